@@ -2,6 +2,7 @@
 
 import logging
 import math
+import os
 import shutil
 from pathlib import Path
 from typing import Any
@@ -13,9 +14,9 @@ import pygeoops
 import rasterio as rio
 import rasterio.features as rio_features
 import rasterio.transform as rio_transform
+import shapely
 import shapely.geometry as sh_geom
 import skimage.filters.rank
-import tensorflow as tf
 from skimage.morphology import rectangle
 
 from orthoseg.helpers import vectorfile_helper
@@ -334,10 +335,9 @@ def to_binary_uint8(in_arr: np.ndarray, thresshold_ok: int = 128) -> np.ndarray:
     if in_arr.dtype != np.uint8:
         raise ValueError(f"Input should be dtype = uint8, not: {in_arr.dtype}")
 
-    # First copy to new numpy array, otherwise input array is changed
-    out_arr = np.copy(in_arr)
-    out_arr[out_arr >= thresshold_ok] = 255
-    out_arr[out_arr < thresshold_ok] = 0
+    # Thresshold in a single pass to a new array, so the input array isn't changed
+    out_arr = np.greater_equal(in_arr, thresshold_ok).view(np.uint8)
+    out_arr *= 255
 
     return out_arr
 
@@ -409,24 +409,6 @@ def postprocess_for_evaluation(
 
         # Determine the prefix to use for the output filenames
         pred_prefix_str = ""
-        """
-        def jaccard_similarity(im1: np.ndarray, im2: np.ndarray):
-            if im1.shape != im2.shape:
-                message = f"input shapes mismatch: im1: {im1.shape}, im2: {im2.shape}"
-                logger.critical(message)
-                raise ValueError(message)
-
-            intersection = np.logical_and(im1, im2)
-            union = np.logical_or(im1, im2)
-
-            sum_union = float(union.sum())
-            if sum_union == 0.0:
-                # If 0 positive pixels in union: perfect prediction, so 1
-                return 1
-            else:
-                sum_intersect = intersection.sum()
-                return sum_intersect/sum_union
-        """
 
         # If there is a mask dir specified... use the groundtruth mask
         if input_mask_dir is not None and input_mask_dir.exists():
@@ -454,24 +436,18 @@ def postprocess_for_evaluation(
 
             # Make the pixels at the borders of the mask black so they are
             # ignored in the comparison
-            if border_pixels_to_ignore and border_pixels_to_ignore > 0:
-                mask_arr[0:border_pixels_to_ignore, :] = 0  # Left border
-                mask_arr[-border_pixels_to_ignore:, :] = 0  # Right border
-                mask_arr[:, 0:border_pixels_to_ignore] = 0  # Top border
-                mask_arr[:, -border_pixels_to_ignore:] = 0  # Bottom border
-
-            # If there is more than 1 class, extract the seperate masks
-            # per class with one-hot encoding
+            _set_border_to_zero(mask_arr, border_pixels_to_ignore)
+
+            # If there is more than 1 class, extract the mask for this class. This
+            # is the same as the one-hot encoded channel of the class, but without
+            # creating the float arrays for all classes.
             if nb_classes > 1:
-                mask_categorical_arr = tf.keras.utils.to_categorical(
-                    mask_arr, nb_classes
-                )
-                mask_arr = (mask_categorical_arr[:, :, class_id]) * 255
+                mask_arr = np.equal(mask_arr, class_id).view(np.uint8)
+                mask_arr *= 255
 
-            # similarity = jaccard_similarity(mask_arr, image_pred)
             # Use accuracy as similarity... is more practical than jaccard
             similarity = (
-                np.array(np.equal(mask_arr, image_pred_uint8_cleaned_bin)).sum()
+                np.count_nonzero(np.equal(mask_arr, image_pred_uint8_cleaned_bin))
                 / image_pred_uint8_cleaned_bin.size
             )
             pred_prefix_str = f"{similarity:0.3f}_"
@@ -486,9 +462,10 @@ def postprocess_for_evaluation(
                 mask_copy_dest_filepath,
                 "w",
                 driver="GTiff",
-                compress="lzw",
-                height=mask_arr.shape[1],
-                width=mask_arr.shape[0],
+                compress="zstd",
+                zstd_level=1,
+                height=mask_arr.shape[0],
+                width=mask_arr.shape[1],
                 count=1,
                 dtype=rio.uint8,
                 crs=image_crs,
@@ -526,7 +503,7 @@ def postprocess_for_evaluation(
         )
         image_dest_filepath = Path(str(output_basefilepath) + image_filepath.suffix)
         if not image_dest_filepath.exists():
-            shutil.copyfile(image_filepath, image_dest_filepath)
+            _link_or_copyfile(image_filepath, image_dest_filepath)
 
         # Rename the prediction file so it also contains the prefix,...
         if image_pred_filepath is not None:
@@ -567,62 +544,59 @@ def polygonize_pred_for_evaluation(
         image_transform (_type_): _description_
         output_basefilepath (Path): _description_
     """
+    # If there are no positive pixels, there is nothing to polygonize
+    if np.count_nonzero(image_pred_uint8_bin) == 0:
+        logger.debug("This prediction didn't result in any polygons")
+        return
+
     # Polygonize result
     try:
-        # Returns a list of tupples with (geometry, value)
-        polygonized_records = list(
-            rio_features.shapes(
-                image_pred_uint8_bin,
-                mask=image_pred_uint8_bin,
-                transform=image_transform,
-            )
+        # Returns tupples with (geometry, value), convert them while streaming
+        polygonized_records = rio_features.shapes(
+            image_pred_uint8_bin,
+            mask=image_pred_uint8_bin,
+            transform=image_transform,
         )
+        geoms = [sh_geom.shape(geom) for geom, _ in polygonized_records]
 
         # If nothing found, we can return
-        if len(polygonized_records) == 0:
+        if len(geoms) == 0:
             logger.debug("This prediction didn't result in any polygons")
             return
 
         # Convert shapes to geopandas geodataframe
-        geoms = []
-        for geom, _ in polygonized_records:
-            geoms.append(sh_geom.shape(geom))
         geoms_gdf = gpd.GeoDataFrame(geoms, columns=["geometry"])
         geoms_gdf.crs = image_crs
 
-        image_shape = image_pred_uint8_bin.shape
-        image_width = image_shape[0]
-        image_height = image_shape[1]
+        # The profile to use for all rasters written
+        image_height, image_width = image_pred_uint8_bin.shape
+        profile = {
+            "driver": "GTiff",
+            "compress": "zstd",
+            "zstd_level": 1,
+            "height": image_height,
+            "width": image_width,
+            "count": 1,
+            "dtype": rio.uint8,
+            "crs": image_crs,
+            "transform": image_transform,
+        }
 
         # For easier evaluation, write the cleaned version as raster
         # Write the standard cleaned output to file
         logger.debug("Save binary prediction")
         image_pred_cleaned_filepath = Path(f"{output_basefilepath!s}_pred_bin.tif")
-        with rio.open(
-            image_pred_cleaned_filepath,
-            "w",
-            driver="GTiff",
-            compress="lzw",
-            height=image_height,
-            width=image_width,
-            count=1,
-            dtype=rio.uint8,
-            crs=image_crs,
-            transform=image_transform,
-        ) as dst:
+        with rio.open(image_pred_cleaned_filepath, "w", **profile) as dst:
             dst.write(image_pred_uint8_bin, 1)
 
         # If the input image contained a transform, also create an image
         # based on the simplified vectors
         if image_transform[0] != 0 and len(geoms) > 0:
-            # Simplify geoms
-            geoms_simpl = []
-            for geom in geoms:
-                # The simplify of shapely uses the deuter-pecker algo
-                # preserve_topology is slower bu makes sure no polygons are removed
-                geom_simpl = geom.simplify(0.5, preserve_topology=True)
-                if not geom_simpl.is_empty:
-                    geoms_simpl.append(geom_simpl)
+            # Simplify geoms, vectorized for all geoms at once.
+            # The simplify of shapely uses the deuter-pecker algo
+            # preserve_topology is slower bu makes sure no polygons are removed
+            geoms_simpl = shapely.simplify(geoms, 0.5, preserve_topology=True)
+            geoms_simpl = geoms_simpl[~shapely.is_empty(geoms_simpl)]
 
             # Write simplified wkt result to raster for comparing.
             if len(geoms_simpl) > 0:
@@ -631,18 +605,7 @@ def polygonize_pred_for_evaluation(
                 image_pred_simpl_filepath = (
                     f"{output_basefilepath!s}_pred_cleaned_simpl.tif"
                 )
-                with rio.open(
-                    image_pred_simpl_filepath,
-                    "w",
-                    driver="GTiff",
-                    compress="lzw",
-                    height=image_height,
-                    width=image_width,
-                    count=1,
-                    dtype=rio.uint8,
-                    crs=image_crs,
-                    transform=image_transform,
-                ) as dst:
+                with rio.open(image_pred_simpl_filepath, "w", **profile) as dst:
                     # create a generator of geom, value pairs to use in rasterizing
                     logger.debug("Before rasterize")
                     burned = rio_features.rasterize(
@@ -814,21 +777,21 @@ def polygonize_pred_multiclass(
     """
     # Convert prediction to uint8 if needed
     if image_pred_arr.dtype == np.float32:
-        image_pred_uint8 = np.array((image_pred_arr * 255), dtype=np.uint8)
+        image_pred_uint8 = np.empty(image_pred_arr.shape, dtype=np.uint8)
+        np.multiply(image_pred_arr, 255, out=image_pred_uint8, casting="unsafe")
     else:
         image_pred_uint8 = image_pred_arr
 
     # Reverse the one-hot decoding so each class has it's own number in the array,
-    # but ignore prediction probability < min_probability
-    image_pred_uint8[image_pred_uint8 < math.floor(255 * min_probability)] = 0
+    # but ignore prediction probability < min_probability. Pixels where no class
+    # reaches min_probability are set to background based on their maximum
+    # probability, so the input array doesn't need to be copied or changed.
     image_pred_decoded_arr = np.argmax(image_pred_uint8, axis=2).astype(np.uint8)
+    image_pred_max_arr = image_pred_uint8.max(axis=2)
+    image_pred_decoded_arr[image_pred_max_arr < math.floor(255 * min_probability)] = 0
 
     # Make the pixels at the borders of the prediction black so they are ignored
-    if border_pixels_to_ignore and border_pixels_to_ignore > 0:
-        image_pred_decoded_arr[0:border_pixels_to_ignore, :] = 0  # Left border
-        image_pred_decoded_arr[-border_pixels_to_ignore:, :] = 0  # Right border
-        image_pred_decoded_arr[:, 0:border_pixels_to_ignore] = 0  # Top border
-        image_pred_decoded_arr[:, -border_pixels_to_ignore:] = 0  # Bottom border
+    _set_border_to_zero(image_pred_decoded_arr, border_pixels_to_ignore)
 
     # Postprocessing on the raster output
     if len(postprocess) > 0:
@@ -838,16 +801,20 @@ def polygonize_pred_multiclass(
             and postprocess["filter_background_modal_size"] is not None
             and postprocess["filter_background_modal_size"] > 0
         ):
-            filter_background_modal_size = postprocess["filter_background_modal_size"]
-            image_pred_decoded_modal_arr = skimage.filters.rank.modal(
-                image_pred_decoded_arr,
-                rectangle(filter_background_modal_size, filter_background_modal_size),
-            )
-            np.copyto(
-                image_pred_decoded_arr,
-                image_pred_decoded_modal_arr,
-                where=image_pred_decoded_arr == 0,
-            )
+            # The modal filter only fills up background pixels based on their
+            # neighbours, so it is only useful if there are both background and
+            # foreground pixels.
+            nb_foreground = np.count_nonzero(image_pred_decoded_arr)
+            if 0 < nb_foreground < image_pred_decoded_arr.size:
+                size = postprocess["filter_background_modal_size"]
+                image_pred_decoded_modal_arr = skimage.filters.rank.modal(
+                    image_pred_decoded_arr, rectangle(size, size)
+                )
+                np.copyto(
+                    image_pred_decoded_arr,
+                    image_pred_decoded_modal_arr,
+                    where=image_pred_decoded_arr == 0,
+                )
 
     # Polygonize
     # If a reclassify query is specified don't mask so the query is also applied to
@@ -870,9 +837,7 @@ def polygonize_pred_multiclass(
         return None
 
     # Calculate the bounds of the image in projected coordinates
-    image_shape = image_pred_decoded_arr.shape
-    image_width = image_shape[0]
-    image_height = image_shape[1]
+    image_height, image_width = image_pred_decoded_arr.shape
     image_bounds = rio_transform.array_bounds(
         image_height, image_width, image_transform
     )
@@ -958,28 +923,31 @@ def polygonize_pred(
     Returns:
         Optional[gpd.GeoDataFrame]: _description_
     """
+    # If the background is masked and there are no other pixels, there is nothing to
+    # polygonize.
+    if mask_background and np.count_nonzero(image_pred_uint8_bin) == 0:
+        return None
+
     # Polygonize result
     try:
-        # Returns a list of tupples with (geometry, value)
+        # Returns tupples with (geometry, value), convert them while streaming
         mask = None
         if mask_background:
             mask = image_pred_uint8_bin
-        polygonized_records = list(
-            rio_features.shapes(
-                image_pred_uint8_bin,
-                mask=mask,
-                transform=image_transform,
-            )
+        polygonized_records = rio_features.shapes(
+            image_pred_uint8_bin,
+            mask=mask,
+            transform=image_transform,
         )
+        data = [
+            (sh_geom.shape(geom), int(value)) for geom, value in polygonized_records
+        ]
 
         # If nothing found, we can return
-        if len(polygonized_records) == 0:
+        if len(data) == 0:
             return None
 
         # Convert shapes to geopandas geodataframe
-        data = [
-            (sh_geom.shape(geom), int(value)) for geom, value in polygonized_records
-        ]
         result_gdf = gpd.GeoDataFrame(
             data, columns=["geometry", "value"], crs=image_crs
         )
@@ -1054,13 +1022,12 @@ def clean_and_save_prediction(
             border_pixels_to_ignore=border_pixels_to_ignore,
         )
 
-        # If the cleaned result contains useful values or in evaluate mode... save
+        # If the cleaned result contains useful values or in evaluate mode... save.
+        # Use max() to check for useful values: it doesn't need a boolean array.
         if (
             min_probability == 0
-            or np.any(
-                image_pred_uint8_cleaned_curr >= math.floor(min_probability * 255)
-            )
             or evaluate_mode is True
+            or image_pred_uint8_cleaned_curr.max() >= math.floor(min_probability * 255)
         ):
             # Find the class name in the classes list
             class_name = None
@@ -1085,16 +1052,14 @@ def clean_and_save_prediction(
 
             # Postprocess for evaluation
             if evaluate_mode:
-                # Create binary version and postprocess
-                image_pred_uint8_cleaned_bin = to_binary_uint8(
-                    image_pred_uint8_cleaned_curr, 125
-                )
+                # The cleaned prediction is already binary (0 or 255), so it can be
+                # used as such
                 postprocess_for_evaluation(
                     image_filepath=input_image_filepath,
                     image_crs=image_crs,
                     image_transform=image_transform,
                     image_pred_filepath=image_pred_filepath,
-                    image_pred_uint8_cleaned_bin=image_pred_uint8_cleaned_bin,
+                    image_pred_uint8_cleaned_bin=image_pred_uint8_cleaned_curr,
                     output_dir=output_dir,
                     output_suffix=output_suffix,
                     input_image_dir=input_image_dir,
@@ -1117,7 +1082,9 @@ def clean_prediction(
     """Cleans a prediction result and returns a cleaned, uint8 array.
 
     Args:
-        image_pred_arr (np.array): The prediction as returned by keras.
+        image_pred_arr (np.array): The prediction of one class as returned by keras,
+            with shape (height, width). For backwards compatibility, a single channel
+            array with shape (height, width, 1) is supported as well.
         border_pixels_to_ignore (int, optional): number of pixels at all borders that
             should be ignored. Defaults to 0.
         output_color_depth (str, optional): Color depth desired. Defaults to '2'.
@@ -1125,7 +1092,7 @@ def clean_prediction(
             * full: 256 different values
 
     Returns:
-        np.array: The cleaned result.
+        np.array: The cleaned result, with shape (height, width).
     """
     # Input should be float32
     if image_pred_arr.dtype not in [np.float32, np.uint8]:
@@ -1135,38 +1102,39 @@ def clean_prediction(
     if output_color_depth not in ["binary", "full"]:
         raise Exception(f"Unsupported output_color_depth: {output_color_depth}")
 
-    # Reshape from 3 to 2 dims if necessary (width, height, nb_channels).
+    # Reduce from 3 to 2 dims if necessary (height, width, nb_channels).
     # Check the number of channels of the output prediction
-    image_pred_shape = image_pred_arr.shape
-    if len(image_pred_shape) > 2:
-        n_channels = image_pred_shape[2]
-        if n_channels > 1:
+    if image_pred_arr.ndim > 2:
+        if image_pred_arr.shape[2] > 1:
             raise ValueError("Invalid input, should be one channel!")
-        # Reshape array from 3 dims (width, height, nb_channels) to 2.
-        image_pred_uint8 = np.reshape(
-            image_pred_arr, (image_pred_shape[0], image_pred_shape[1])
-        )
-
-    # Convert to uint8 if necessary
-    if image_pred_arr.dtype == np.float32:
-        image_pred_uint8 = np.array((image_pred_arr * 255), dtype=np.uint8)
+        # Squeeze the channel dimension: this always gives a view, never a copy
+        image_pred_arr = image_pred_arr.squeeze(axis=2)
+
+    if image_pred_arr.dtype == np.float32 and output_color_depth == "binary":
+        # Thresshold the probabilities directly into a new uint8 array. This gives the
+        # same result as thressholding at 127 after converting to uint8, without the
+        # intermediate float and uint8 arrays.
+        image_pred_uint8 = np.empty(image_pred_arr.shape, dtype=np.uint8)
+        np.greater_equal(image_pred_arr, 127 / 255, out=image_pred_uint8.view(bool))
+        image_pred_uint8 *= 255
     else:
-        image_pred_uint8 = image_pred_arr
+        # Convert to uint8 if necessary
+        if image_pred_arr.dtype == np.float32:
+            image_pred_uint8 = np.empty(image_pred_arr.shape, dtype=np.uint8)
+            np.multiply(image_pred_arr, 255, out=image_pred_uint8, casting="unsafe")
+        else:
+            image_pred_uint8 = image_pred_arr
 
-    # Convert to binary if needed
-    if output_color_depth == "binary":
-        image_pred_uint8[image_pred_uint8 >= 127] = 255
-        image_pred_uint8[image_pred_uint8 < 127] = 0
+        # Convert to binary if needed. The thresshold is applied in a single pass,
+        # writing the result in-place as 0/1 values that are scaled to 0/255.
+        if output_color_depth == "binary":
+            np.greater_equal(image_pred_uint8, 127, out=image_pred_uint8.view(bool))
+            image_pred_uint8 *= 255
 
     # Make the pixels at the borders of the prediction black so they are ignored
-    image_pred_uint8_cropped = image_pred_uint8
-    if border_pixels_to_ignore and border_pixels_to_ignore > 0:
-        image_pred_uint8_cropped[0:border_pixels_to_ignore, :] = 0  # Left border
-        image_pred_uint8_cropped[-border_pixels_to_ignore:, :] = 0  # Right border
-        image_pred_uint8_cropped[:, 0:border_pixels_to_ignore] = 0  # Top border
-        image_pred_uint8_cropped[:, -border_pixels_to_ignore:] = 0  # Bottom border
+    _set_border_to_zero(image_pred_uint8, border_pixels_to_ignore)
 
-    return image_pred_uint8_cropped
+    return image_pred_uint8
 
 
 def save_prediction_uint8(
@@ -1197,15 +1165,14 @@ def save_prediction_uint8(
 
     # Write prediction to file
     logger.debug("Save +- original prediction")
-    image_shape = image_pred_uint8_cleaned.shape
-    image_width = image_shape[0]
-    image_height = image_shape[1]
+    image_height, image_width = image_pred_uint8_cleaned.shape
     with rio.open(
         str(output_path),
         "w",
         driver="GTiff",
         tiled="no",
-        compress="lzw",
+        compress="zstd",
+        zstd_level=1,
         predictor=2,
         num_threads=4,
         height=image_height,
@@ -1218,6 +1185,40 @@ def save_prediction_uint8(
         dst.write(image_pred_uint8_cleaned, 1)
 
 
+def _link_or_copyfile(src: Path, dst: Path):
+    """Create a hard link to the source file, or copy it if linking isn't possible.
+
+    A hard link avoids copying the file data, but it is only possible if the source
+    and the destination are on the same file system and this supports hard links.
+
+    Args:
+        src (Path): the file to link or copy.
+        dst (Path): the destination path.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _set_border_to_zero(image_arr: np.ndarray, border_pixels: int):
+    """Set the pixels at the borders of the image to 0, in-place.
+
+    Args:
+        image_arr (np.ndarray): the image to set the borders to 0 for. The first two
+            dimensions should be the rows and columns of the image.
+        border_pixels (int): number of pixels at all borders to set to 0. If 0 or
+            None, the image is left untouched.
+    """
+    if not border_pixels or border_pixels <= 0:
+        return
+
+    image_arr[:border_pixels] = 0  # Top border
+    image_arr[-border_pixels:] = 0  # Bottom border
+    image_arr[:, :border_pixels] = 0  # Left border
+    image_arr[:, -border_pixels:] = 0  # Right border
+
+
 # -------------------------------------------------------------
 # Helpers for working with Affine objects...
 # -------------------------------------------------------------
@@ -1,5 +1,6 @@
 """Module with high-level operations to segment images."""
 
+import contextlib
 import csv
 import datetime
 import json
@@ -443,17 +444,20 @@ def _predict_layer(
     image_id = -1
     last_image_reached = False
 
-    # We don't want the postprocess workers to block the entire system,
-    # so make them a bit nicer
-    def init_postprocess_worker():
-        general_util.setprocessnice(15)
-
     with (
         futures.ThreadPoolExecutor(nb_parallel_read) as read_pool,
         futures.ProcessPoolExecutor(
-            nb_parallel_postprocess, initializer=init_postprocess_worker()
+            nb_parallel_postprocess, initializer=_init_postprocess_worker
         ) as postprocess_pool,
         futures.ProcessPoolExecutor(max_workers=1) as write_pool,
+        # Without vector output, the images done are logged here, so keep the log
+        # open during the run. It is line buffered so each image is still logged as
+        # soon as it is done.
+        (
+            images_done_log_filepath.open("a", buffering=1)
+            if output_vector_path is None
+            else contextlib.nullcontext()
+        ) as images_done_log_file,
     ):
         # Start looping.
         # If ready to stop, the code below will break
@@ -613,6 +617,12 @@ def _predict_layer(
                 else:
                     batch_pred_arr = np.array(batch_pred_arr)
 
+                # The postprocessing converts the predictions to uint8 anyway, so
+                # convert them here already: this makes the data to be sent to the
+                # postprocess worker processes 4 times smaller.
+                batch_pred_uint8 = np.empty(batch_pred_arr.shape, dtype=np.uint8)
+                np.multiply(batch_pred_arr, 255, out=batch_pred_uint8, casting="unsafe")
+
                 # Add predictions to postprocess queue
                 # ------------------------------------
                 logger.debug("Start post-processing")
@@ -637,7 +647,7 @@ def _predict_layer(
 
                         future = postprocess_pool.submit(
                             postp.postprocess_prediction_to_file,
-                            image_pred_arr=batch_pred_arr[batch_image_id],
+                            image_pred_arr=batch_pred_uint8[batch_image_id],
                             image_crs=image_info["image_crs"],
                             image_transform=image_info["image_transform"],
                             classes=classes,
@@ -686,10 +696,8 @@ def _predict_layer(
 
                         if output_vector_path is None:
                             # No vector output, so we are ready with this image
-                            with images_done_log_filepath.open(
-                                "a+"
-                            ) as image_donelog_file:
-                                image_donelog_file.write(f"{image_path.name}\n")
+                            assert images_done_log_file is not None
+                            images_done_log_file.write(f"{image_path.name}\n")
 
                             nb_done += 1
                         else:
@@ -816,6 +824,22 @@ def _predict_layer(
             shutil.rmtree(output_image_dir)
 
 
+def _init_postprocess_worker():
+    """Initialize a postprocess worker process.
+
+    The worker is made a bit nicer so it doesn't block the entire system, and the
+    heavy modules used for postprocessing are imported once at startup so this cost
+    isn't paid while processing the first images.
+    """
+    general_util.setprocessnice(15)
+
+    import rasterio.features  # noqa: F401
+    import shapely  # noqa: F401
+    import skimage.filters.rank  # noqa: F401
+
+    import orthoseg.lib.postprocess_predictions  # noqa: F401
+
+
 def _write_vector_result(
     image_path: Path,
     partial_vector_path: Path,
@@ -882,9 +906,10 @@ def read_image(image_path: Path, projection_if_missing: str | None = None) -> di
                 image_data = image_ds.read()
 
             # change from (channels, width, height) to
-            # (width, height, channels) + normalize to between 0 and 1
+            # (width, height, channels) + normalize to between 0 and 1. Use float32
+            # directly as this is what the model uses anyway.
             image_data = rio_plot.reshape_as_image(image_data)
-            image_data = image_data / 255.0
+            image_data = np.divide(image_data, 255, dtype=np.float32)
 
             # Read worked, so jump out of the loop...
             break
@@ -956,9 +981,10 @@ def load_image(
     )
 
     # change from (channels, width, height) to
-    # (width, height, channels) + normalize to between 0 and 1
+    # (width, height, channels) + normalize to between 0 and 1. Use float32
+    # directly as this is what the model uses anyway.
     image_data = rio_plot.reshape_as_image(image_data)
-    image_data = image_data / 255.0
+    image_data = np.divide(image_data, 255, dtype=np.float32)
 
     # Now return the result
     image = {
@@ -1,11 +1,16 @@
 """Module to prepare the training datasets."""
 
+import json
 import logging
 import math
+import os
 import pprint
+import re
 import shutil
 import warnings
+from concurrent import futures
 from pathlib import Path
+from typing import TextIO
 
 import geofileops as gfo
 import geopandas as gpd
@@ -13,7 +18,7 @@ import numpy as np
 import pandas as pd
 import rasterio as rio
 import rasterio.features as rio_features
-import rasterio.profiles as rio_profiles
+import rasterio.transform as rio_transform
 import shapely
 import shapely.geometry as sh_geom
 from PIL import Image
@@ -24,6 +29,18 @@ from orthoseg.util.progress_util import ProgressLogger
 # Get a logger...
 logger = logging.getLogger(__name__)
 
+# Cache size (MB) GDAL can use while rasterizing the masks. If the output buffer is
+# larger than GDAL_CACHEMAX, rasterize falls back to a much slower implementation. An
+# explicit GDAL_CACHEMAX environment variable takes precedence.
+RASTERIZE_GDAL_CACHEMAX = 512
+
+# File in the temp dir of a training data version listing the images downloaded, so
+# they can be reused if the preparation is interrupted and run again.
+IMAGES_MANIFEST_NAME = "images_manifest.jsonl"
+
+# Name of a training data version dir, e.g. "01"
+_DATAVERSION_DIR_PATTERN = re.compile(r"[0-9]+")
+
 
 class LabelInfo:
     """Information needed to find train labels."""
@@ -159,7 +176,8 @@ def prepare_traindatasets(
                 - labelnames: list of labels to use for this class
                 - weight:
                 - burn_value:
-        image_layers (dict): the image layers available with their properties.
+        image_layers (dict): the image layers available with their properties. The
+            images of a layer are downloaded with `nb_concurrent_calls` threads.
         training_dir (Path): the directory to save the training data to.
         labelname_column (str): the column where the label names are stored in
             the polygon files. If the column name specified is not found, column
@@ -190,20 +208,23 @@ def prepare_traindatasets(
     # Check if the latest version of training data is already ok
     # Determine the current data version based on existing output data dir(s),
     # If dir ends on _TMP_* ignore it, as it (probably) ended with an error.
-    output_dirs = [
-        output_dir
-        for output_dir in training_dir.glob("[0-9]*/")
-        if "_TMP_" not in output_dir.name
-    ]
+    dataversion_dirs = {}
+    if training_dir.exists():
+        with os.scandir(training_dir) as entries:
+            dataversion_dirs = {
+                int(entry.name): Path(entry.path)
+                for entry in entries
+                if _DATAVERSION_DIR_PATTERN.fullmatch(entry.name) and entry.is_dir()
+            }
 
     reuse_traindata = False
     dataversion_mostrecent = None
-    if len(output_dirs) == 0:
+    if len(dataversion_dirs) == 0:
         dataversion_new = 1
     else:
-        # Get the output dir with the highest version (=first if sorted desc)
-        output_dir_mostrecent = sorted(output_dirs, reverse=True)[0]
-        dataversion_mostrecent = int(output_dir_mostrecent.name)
+        # Get the output dir with the highest version
+        dataversion_mostrecent = max(dataversion_dirs)
+        output_dir_mostrecent = dataversion_dirs[dataversion_mostrecent]
 
         # If none of the input files changed since previous run, reuse dataset
         for label_file in label_infos:
@@ -264,8 +285,13 @@ def prepare_traindatasets(
 
     # Prepare temp dir to put training dataset in.
     # Use a temp dir, so it can be removed/ignored if an error occurs later on.
+    # Existing temp dirs of interrupted runs are only removed at the end, so the images
+    # already downloaded in them can be reused.
+    interrupted_images = _read_images_manifests(training_dir, f"{dataversion_new:02d}")
+    if len(interrupted_images) > 0:
+        logger.info(f"Reuse {len(interrupted_images)} images of interrupted run(s)")
     output_tmp_dir = create_tmp_dir(
-        training_dir, f"{dataversion_new:02d}", remove_existing=True
+        training_dir, f"{dataversion_new:02d}", remove_existing=False
     )
 
     # Copy the label input files to dest dir + to a backup dir.
@@ -290,117 +316,224 @@ def prepare_traindatasets(
     progress = ProgressLogger(message="prepare training images", nb_steps_total=nb_todo)
     logger.info(f"Get images for {nb_todo} labels")
 
-    for traindata_type in traindata_types:
-        if dataversion_mostrecent is not None:
-            previous_dataversion_dir = training_dir / f"{dataversion_mostrecent:02d}"
-            previous_imagedata_image_dir = (
-                previous_dataversion_dir / traindata_type / "image"
-            )
-        # Create output dirs...
-        output_imagedatatype_dir = output_tmp_dir / traindata_type
-        output_imagedata_image_dir = output_imagedatatype_dir / "image"
-        output_imagedata_mask_dir = output_imagedatatype_dir / "mask"
-        for dir in [
-            output_imagedatatype_dir,
-            output_imagedata_mask_dir,
-            output_imagedata_image_dir,
-        ]:
-            if dir and not dir.exists():
-                dir.mkdir(parents=True, exist_ok=True)
-
-        for labellocations_gdf, labels_to_burn_gdf in labeldata:
-            # Get the label locations for this traindata type
-            labellocations_curr_gdf = labellocations_gdf[
-                labellocations_gdf["traindata_type"] == traindata_type
-            ]
-
-            # Loop trough all locations labels to get an image for each of them
-            for i, label_tuple in enumerate(labellocations_curr_gdf.itertuples()):
-                img_bbox = label_tuple.geometry
-                image_layer = getattr(label_tuple, "image_layer")
-
-                # Prepare file name for the image
-                assert labellocations_gdf.crs is not None
-                output_filename = image_util.create_filename(
-                    crs=labellocations_gdf.crs,
-                    bbox=img_bbox.bounds,
-                    size=(image_pixel_width, image_pixel_height),
-                    image_format=image_util.FORMAT_PNG,
-                    layername="_".join(
-                        image_layers[image_layer]["layersources"][0].layernames
-                    ),
+    # The images that need to be downloaded are fetched in background threads. As soon
+    # as an image is available, its mask is created in a mask thread so downloading
+    # and rasterizing overlap. Rasterizing and writing the masks release the GIL and
+    # the mask threads only share read-only label data, so use multiple mask threads.
+    nb_classes = len(classes)
+    download_pools: dict[str, futures.ThreadPoolExecutor] = {}
+    nb_mask_workers = os.cpu_count() or 1
+    mask_pool = futures.ThreadPoolExecutor(nb_mask_workers)
+    queue: dict[futures.Future, dict | None] = {}
+    nb_queued_max = 2 * nb_mask_workers
+    images_manifest = (output_tmp_dir / IMAGES_MANIFEST_NAME).open("a", buffering=1)
+    try:
+        for traindata_type in traindata_types:
+            if dataversion_mostrecent is not None:
+                previous_dataversion_dir = (
+                    training_dir / f"{dataversion_mostrecent:02d}"
                 )
-
-                # If the image exists already in the previous version, reuse it.
-                if (
-                    dataversion_mostrecent is not None
-                    and (previous_imagedata_image_dir / output_filename).exists()
+                previous_imagedata_image_dir = (
+                    previous_dataversion_dir / traindata_type / "image"
+                )
+            # Create output dirs...
+            output_imagedatatype_dir = output_tmp_dir / traindata_type
+            output_imagedata_image_dir = output_imagedatatype_dir / "image"
+            output_imagedata_mask_dir = output_imagedatatype_dir / "mask"
+            for dir in [
+                output_imagedatatype_dir,
+                output_imagedata_mask_dir,
+                output_imagedata_image_dir,
+            ]:
+                if dir and not dir.exists():
+                    dir.mkdir(parents=True, exist_ok=True)
+
+            # Locations are aligned to the pixel grid, so identical images can be
+            # recognized by their bounds in pixel units.
+            tiles_done: set[tuple[str, int, int, int, int]] = set()
+            for labellocations_gdf, labels_to_burn_gdf in labeldata:
+                # Get the label locations for this traindata type
+                labellocations_curr_gdf = labellocations_gdf[
+                    labellocations_gdf["traindata_type"] == traindata_type
+                ]
+
+                # Only keep the labels that are meant for each image layer. Do this once
+                # here, as plain arrays + a spatial index on them, so they can be
+                # reused for all locations without pandas overhead.
+                if "image_layer" not in labels_to_burn_gdf.columns:
+                    print("odd")
+                labels_per_layer = {}
+                for image_layer in labellocations_curr_gdf["image_layer"].unique():
+                    labels_layer_gdf = labels_to_burn_gdf.loc[
+                        labels_to_burn_gdf["image_layer"] == image_layer
+                    ]
+                    if len(labels_layer_gdf) == 0:
+                        logger.info(f"No polygons to burn for {image_layer=}!")
+                    burn_geoms = labels_layer_gdf.geometry.to_numpy()
+                    labels_per_layer[image_layer] = {
+                        "burn_geoms": burn_geoms,
+                        "burn_values": labels_layer_gdf["burn_value"].to_numpy(),
+                        "burn_geoms_tree": shapely.STRtree(burn_geoms),
+                    }
+
+                # Determine the bounds in pixel units of all locations at once, so
+                # duplicate locations can be filtered out before looping over them.
+                tiles_df = pd.DataFrame(
+                    np.round(
+                        shapely.bounds(labellocations_curr_gdf.geometry.to_numpy())
+                        / [
+                            image_pixel_x_size,
+                            image_pixel_y_size,
+                            image_pixel_x_size,
+                            image_pixel_y_size,
+                        ]
+                    ).astype(np.int64),
+                    columns=["xmin", "ymin", "xmax", "ymax"],
+                )
+                tiles_df.insert(
+                    0, "image_layer", labellocations_curr_gdf["image_layer"].to_numpy()
+                )
+                is_duplicate = tiles_df.duplicated().to_numpy()
+                if is_duplicate.any():
+                    logger.debug(f"Skip {is_duplicate.sum()} duplicate locations")
+                    progress.step(nb_steps=int(is_duplicate.sum()))
+
+                # Loop trough all locations labels to get an image for each of them
+                for label_tuple, tile_key in zip(
+                    labellocations_curr_gdf[~is_duplicate].itertuples(),
+                    tiles_df[~is_duplicate].itertuples(index=False, name=None),
                 ):
-                    image_filepath = shutil.copy(
-                        src=previous_imagedata_image_dir / output_filename,
-                        dst=output_imagedata_image_dir / output_filename,
-                    )
-                    pgw_filename = output_filename.replace(".png", ".pgw")
-                    if (previous_imagedata_image_dir / pgw_filename).exists():
-                        shutil.copy(
-                            src=previous_imagedata_image_dir / pgw_filename,
-                            dst=output_imagedata_image_dir / pgw_filename,
-                        )
-                else:
-                    # Get the image from the WMS service.
-                    image_filepath = image_util.load_image_to_file(
-                        layersources=image_layers[image_layer]["layersources"],
-                        output_dir=output_imagedata_image_dir,
+                    img_bbox = label_tuple.geometry
+                    image_layer = getattr(label_tuple, "image_layer")
+
+                    # If the image for this location was already created for another
+                    # label file, skip it
+                    if tile_key in tiles_done:
+                        logger.debug(f"Skip duplicate location {img_bbox.bounds}")
+                        progress.step()
+                        continue
+                    tiles_done.add(tile_key)
+
+                    # Prepare file name for the image
+                    assert labellocations_gdf.crs is not None
+                    output_filename = image_util.create_filename(
                         crs=labellocations_gdf.crs,
                         bbox=img_bbox.bounds,
                         size=(image_pixel_width, image_pixel_height),
-                        ssl_verify=ssl_verify,
                         image_format=image_util.FORMAT_PNG,
-                        # image_format_save=image_util.FORMAT_TIFF,
-                        image_pixels_ignore_border=image_layers[image_layer][
-                            "image_pixels_ignore_border"
-                        ],
-                        transparent=False,
-                        layername_in_filename=True,
-                        output_filename=output_filename,
+                        layername="_".join(
+                            image_layers[image_layer]["layersources"][0].layernames
+                        ),
                     )
 
-                # Create a mask corresponding with the image file
-                # Mask should never be in a lossy format -> png!
-                mask_filepath = Path(
-                    str(image_filepath)
-                    .replace(
-                        str(output_imagedata_image_dir),
-                        str(output_imagedata_mask_dir),
+                    # If the image exists already in the previous version or was
+                    # downloaded in an interrupted run, reuse it.
+                    reuse_image_path = None
+                    if (
+                        dataversion_mostrecent is not None
+                        and (previous_imagedata_image_dir / output_filename).exists()
+                    ):
+                        reuse_image_path = (
+                            previous_imagedata_image_dir / output_filename
+                        )
+                    elif output_filename in interrupted_images:
+                        reuse_image_path = interrupted_images[output_filename]
+
+                    if reuse_image_path is not None:
+                        # Only the file contents are needed. On Linux, copyfile uses a
+                        # fast in-kernel copy.
+                        image_filepath = shutil.copyfile(
+                            src=reuse_image_path,
+                            dst=output_imagedata_image_dir / output_filename,
+                        )
+                        pgw_filename = output_filename.replace(".png", ".pgw")
+                        if (reuse_image_path.parent / pgw_filename).exists():
+                            shutil.copyfile(
+                                src=reuse_image_path.parent / pgw_filename,
+                                dst=output_imagedata_image_dir / pgw_filename,
+                            )
+
+                        # Create a mask corresponding with the image file
+                        future = mask_pool.submit(
+                            _create_mask_for_image,
+                            image_filepath=image_filepath,
+                            image_dir=output_imagedata_image_dir,
+                            mask_dir=output_imagedata_mask_dir,
+                            **labels_per_layer[image_layer],
+                            bbox=img_bbox.bounds,
+                            size=(image_pixel_width, image_pixel_height),
+                            nb_classes=nb_classes,
+                            force=force,
+                        )
+                        queue[future] = None
+                    else:
+                        # Get the image from the WMS service in a background thread.
+                        # Use a pool per image layer to respect its nb_concurrent_calls.
+                        if image_layer not in download_pools:
+                            nb_concurrent_calls = image_layers[image_layer].get(
+                                "nb_concurrent_calls", 1
+                            )
+                            download_pools[image_layer] = futures.ThreadPoolExecutor(
+                                nb_concurrent_calls
+                            )
+                            nb_queued_max += 2 * nb_concurrent_calls
+                        future = download_pools[image_layer].submit(
+                            image_util.load_image_to_file,
+                            layersources=image_layers[image_layer]["layersources"],
+                            output_dir=output_imagedata_image_dir,
+                            crs=labellocations_gdf.crs,
+                            bbox=img_bbox.bounds,
+                            size=(image_pixel_width, image_pixel_height),
+                            ssl_verify=ssl_verify,
+                            image_format=image_util.FORMAT_PNG,
+                            # image_format_save=image_util.FORMAT_TIFF,
+                            image_pixels_ignore_border=image_layers[image_layer][
+                                "image_pixels_ignore_border"
+                            ],
+                            transparent=False,
+                            layername_in_filename=True,
+                            output_filename=output_filename,
+                        )
+                        queue[future] = {
+                            "image_dir": output_imagedata_image_dir,
+                            "mask_dir": output_imagedata_mask_dir,
+                            **labels_per_layer[image_layer],
+                            "bbox": img_bbox.bounds,
+                            "size": (image_pixel_width, image_pixel_height),
+                            "nb_classes": nb_classes,
+                            "force": force,
+                        }
+
+                    _process_queue(
+                        queue=queue,
+                        mask_pool=mask_pool,
+                        nb_queued_max=nb_queued_max,
+                        progress=progress,
+                        images_manifest=images_manifest,
                     )
-                    .replace(".jpg", ".png")
-                )
-                nb_classes = len(classes)
 
-                # Only keep the labels that are meant for this image layer
-                if "image_layer" not in labels_to_burn_gdf.columns:
-                    print("odd")
-                labels_for_layer_gdf = (
-                    labels_to_burn_gdf.loc[
-                        labels_to_burn_gdf["image_layer"] == image_layer
-                    ]
-                ).copy()
-                if len(labels_for_layer_gdf) == 0:
-                    logger.info(f"No polygons to burn for {image_layer=}!")
-                _create_mask(
-                    input_image_filepath=image_filepath,
-                    output_mask_filepath=mask_filepath,
-                    labels_to_burn_gdf=labels_for_layer_gdf,
-                    nb_classes=nb_classes,
-                    force=force,
-                )
-
-                # Log the progress and prediction speed
-                progress.step()
+        # Wait till all images are downloaded and all masks are created
+        _process_queue(
+            queue=queue,
+            mask_pool=mask_pool,
+            nb_queued_max=0,
+            progress=progress,
+            images_manifest=images_manifest,
+        )
+    finally:
+        for download_pool in download_pools.values():
+            download_pool.shutdown(wait=True, cancel_futures=True)
+        mask_pool.shutdown(wait=True, cancel_futures=True)
+        images_manifest.close()
 
     # If everything went fine, rename output_tmp_dir to the final output_dir
+    (output_tmp_dir / IMAGES_MANIFEST_NAME).unlink()
     output_tmp_dir.rename(training_dataversion_dir)
 
+    # The temp dirs of interrupted runs aren't needed anymore
+    for tmp_dir in training_dir.glob(f"{dataversion_new:02d}_TMP_*"):
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
     return (training_dataversion_dir, dataversion_new)
 
 
@@ -498,8 +631,33 @@ def prepare_labeldata(
         image_crs_width = math.fabs(image_pixel_width * pixel_x_size)
         image_crs_height = math.fabs(image_pixel_height * pixel_y_size)
 
+        # Determine the validity and the geometry aligned to the pixel grid for all
+        # locations at once.
+        geoms = labellocations_gdf.geometry.to_numpy()
+        is_valid_reasons = shapely.is_valid_reason(geoms)
+        geoms_bounds = shapely.bounds(geoms)
+        xmins = geoms_bounds[:, 0] - np.mod(geoms_bounds[:, 0], image_pixel_x_size)
+        ymins = geoms_bounds[:, 1] - np.mod(geoms_bounds[:, 1], image_pixel_y_size)
+        geoms_aligned = shapely.box(
+            xmins, ymins, xmins + image_crs_width, ymins + image_crs_height
+        )
+        to_align = (is_valid_reasons == "Valid Geometry") & ~shapely.is_empty(geoms)
+        intersection_areas = np.full(len(geoms), np.nan)
+        intersection_areas[to_align] = shapely.area(
+            shapely.intersection(geoms_aligned[to_align], geoms[to_align])
+        )
+        geoms_aligned_areas = shapely.area(geoms_aligned)
+        geoms_bbox_areas = (geoms_bounds[:, 2] - geoms_bounds[:, 0]) * (
+            geoms_bounds[:, 3] - geoms_bounds[:, 1]
+        )
+        assert image_pixel_x_size is not None
+        assert image_pixel_y_size is not None
+        area_1row_1col = (
+            image_pixel_x_size * image_crs_width + image_pixel_y_size * image_crs_height
+        )
+
         locations_none = []
-        for location in labellocations_gdf.itertuples():
+        for idx, location in enumerate(labellocations_gdf.itertuples()):
             if location.geometry is None or location.geometry.is_empty:
                 logger.warning(
                     f"No or empty geometry found in file {Path(location.path).name} "
@@ -518,47 +676,31 @@ def prepare_labeldata(
                 )
 
             # Check if the geometry is valid
-            is_valid_reason = shapely.is_valid_reason(
-                labellocations_gdf.geometry[location.Index]
-            )
-            if is_valid_reason != "Valid Geometry":
+            if is_valid_reasons[idx] != "Valid Geometry":
                 validation_errors.append(
                     f"Invalid geometry in {Path(location.path).name}: "
-                    f"{is_valid_reason}"
+                    f"{is_valid_reasons[idx]}"
                 )
                 continue
 
-            geom_bounds = location.geometry.bounds
-            xmin = geom_bounds[0] - (geom_bounds[0] % image_pixel_x_size)
-            ymin = geom_bounds[1] - (geom_bounds[1] % image_pixel_y_size)
-            xmax = xmin + image_crs_width
-            ymax = ymin + image_crs_height
-            location_geom_aligned = sh_geom.box(xmin, ymin, xmax, ymax)
-
             # Check if the realigned geom overlaps good enough with the original
-            intersection = location_geom_aligned.intersection(
-                labellocations_gdf.at[location.Index, "geometry"]
-            )
-            assert image_pixel_x_size is not None
-            assert image_pixel_y_size is not None
-            area_1row_1col = (
-                image_pixel_x_size * image_crs_width
-                + image_pixel_y_size * image_crs_height
-            )
-            if intersection.area < (location_geom_aligned.area - area_1row_1col):
+            if intersection_areas[idx] < (geoms_aligned_areas[idx] - area_1row_1col):
                 # Original geom was digitized too small
                 validation_errors.append(
-                    f"Location geometry skewed or too small ({intersection.area}, "
-                    f"based on train config expected {location_geom_aligned.area}) in "
+                    "Location geometry skewed or too small "
+                    f"({intersection_areas[idx]}, based on train config expected "
+                    f"{geoms_aligned_areas[idx]}) in "
                     f"{Path(location.path).name}: {location.geometry.wkt}"
                 )
-            elif sh_geom.box(*geom_bounds).area > location_geom_aligned.area * 1.1:
+            elif geoms_bbox_areas[idx] > geoms_aligned_areas[idx] * 1.1:
                 validation_warnings.append(
-                    f"Location geometry too large ({sh_geom.box(*geom_bounds).area}, "
-                    f"based on train config expected {location_geom_aligned.area}) "
+                    f"Location geometry too large ({geoms_bbox_areas[idx]}, "
+                    f"based on train config expected {geoms_aligned_areas[idx]}) "
                     f"in file {Path(location.path).name}: {location.geometry.wkt}"
                 )
-            labellocations_gdf.at[location.Index, "geometry"] = location_geom_aligned
+
+        # Replace the valid location geometries by the ones aligned to the pixel grid
+        labellocations_gdf.loc[to_align, "geometry"] = geoms_aligned[to_align]
 
         # Remove locations with None or point/line geoms
         labellocations_gdf = labellocations_gdf[
@@ -761,14 +903,126 @@ def create_tmp_dir(
     return tmp_dir
 
 
+def _read_images_manifests(parent_dir: Path, dir_name: str) -> dict[str, Path]:
+    """Read the images manifests in the temp dirs of interrupted runs.
+
+    Args:
+        parent_dir (Path): the dir the temp dirs are located in.
+        dir_name (str): the name of the dir the temp dirs are based on.
+
+    Returns:
+        dict[str, Path]: the image file names with the path of the image.
+    """
+    images = {}
+    for tmp_dir in parent_dir.glob(f"{dir_name}_TMP_*"):
+        manifest_path = tmp_dir / IMAGES_MANIFEST_NAME
+        if not manifest_path.exists():
+            continue
+        with manifest_path.open() as manifest:
+            for line in manifest:
+                try:
+                    image_path = tmp_dir / json.loads(line)["image"]
+                except (json.JSONDecodeError, KeyError):
+                    # The last line can be incomplete if the run was interrupted
+                    continue
+                if image_path.exists():
+                    images[image_path.name] = image_path
+
+    return images
+
+
+def _process_queue(
+    queue: dict[futures.Future, dict | None],
+    mask_pool: futures.ThreadPoolExecutor,
+    nb_queued_max: int,
+    progress: ProgressLogger,
+    images_manifest: TextIO,
+):
+    """Process the downloads and mask creations that are done.
+
+    For each image downloaded, the creation of the mask is submitted to the mask_pool.
+    Waits till the number of futures still queued is at most `nb_queued_max`.
+
+    Args:
+        queue (dict[futures.Future, dict | None]): the futures of the downloads with
+            the info needed to create the corresponding masks and the futures of the
+            mask creations with value None. Futures that are processed are removed
+            from it, mask creations submitted are added.
+        mask_pool (futures.ThreadPoolExecutor): the pool to create the masks in.
+        nb_queued_max (int): the maximum number of futures that can stay queued.
+        progress (ProgressLogger): progress logger to step for each mask created.
+        images_manifest (TextIO): the manifest to add each image downloaded to.
+    """
+    while len(queue) > 0:
+        timeout = None if len(queue) > nb_queued_max else 0
+        futures_done, _ = futures.wait(
+            queue, timeout=timeout, return_when=futures.FIRST_COMPLETED
+        )
+        for future in futures_done:
+            mask_info = queue.pop(future)
+            # Fetch result: will throw exception if something went wrong
+            result = future.result()
+            if mask_info is None:
+                # A mask was created
+                progress.step()
+            else:
+                # An image was downloaded, so add it to the manifest and create the
+                # mask for it
+                image_relpath = Path(result).relative_to(
+                    Path(images_manifest.name).parent
+                )
+                images_manifest.write(
+                    json.dumps({"image": image_relpath.as_posix()}) + "\n"
+                )
+                mask_future = mask_pool.submit(
+                    _create_mask_for_image, image_filepath=result, **mask_info
+                )
+                queue[mask_future] = None
+
+        if len(queue) <= nb_queued_max:
+            break
+
+
+def _create_mask_for_image(
+    image_filepath: Path,
+    image_dir: Path,
+    mask_dir: Path,
+    burn_geoms: np.ndarray,
+    burn_values: np.ndarray,
+    burn_geoms_tree: shapely.STRtree,
+    bbox: tuple[float, float, float, float],
+    size: tuple[int, int],
+    nb_classes: int,
+    force: bool = False,
+):
+    # Mask should never be in a lossy format -> png!
+    mask_filepath = Path(
+        str(image_filepath)
+        .replace(str(image_dir), str(mask_dir))
+        .replace(".jpg", ".png")
+    )
+    _create_mask(
+        output_mask_filepath=mask_filepath,
+        burn_geoms=burn_geoms,
+        burn_values=burn_values,
+        burn_geoms_tree=burn_geoms_tree,
+        bbox=bbox,
+        size=size,
+        nb_classes=nb_classes,
+        force=force,
+    )
+
+
 def _create_mask(
-    input_image_filepath: Path,
     output_mask_filepath: Path,
-    labels_to_burn_gdf: gpd.GeoDataFrame,
+    burn_geoms: np.ndarray,
+    burn_values: np.ndarray,
+    bbox: tuple[float, float, float, float],
+    size: tuple[int, int],
     nb_classes: int = 1,
-    output_imagecopy_filepath: Path | None = None,
     minimum_pct_labeled: float = 0.0,
     force: bool = False,
+    burn_geoms_tree: shapely.STRtree | None = None,
 ) -> bool | None:
     # If file exists already and force is False... stop.
     if force is False and output_mask_filepath.exists():
@@ -777,79 +1031,56 @@ def _create_mask(
         )
         return None
 
-    # Create a mask corresponding with the image file
-    # First read the properties of the input image to copy them for the output
+    # Create a mask corresponding with the image file.
+    # The images are aligned to the bbox asked, so the transform can be determined
+    # without opening the image.
     logger.debug(f"Create mask to {output_mask_filepath}")
-    with rio.open(input_image_filepath) as image_ds:
-        image_input_profile = image_ds.profile
-        image_transform_affine = image_ds.transform
-        bounds = image_ds.bounds
+    width, height = size
+    image_transform_affine = rio_transform.from_bounds(*bbox, width, height)
 
-    # Prepare the file profile for the mask depending on output type
+    # The mask is written directly with PIL, so only .png is supported
     output_ext_lower = output_mask_filepath.suffix.lower()
-    if output_ext_lower == ".tif":
-        image_output_profile = rio_profiles.DefaultGTiffProfile(
-            count=1, transform=image_transform_affine, crs=image_input_profile["crs"]
-        )
-    if output_ext_lower == ".png":
-        image_output_profile = rio_profiles.Profile(driver="PNG", count=1)
-    else:
+    if output_ext_lower != ".png":
         raise Exception(
             f"Unsupported mask suffix (should be lossless format!): {output_ext_lower}"
         )
-    image_output_profile.update(
-        width=image_input_profile["width"],
-        height=image_input_profile["height"],
-        dtype=rio.uint8,
-    )
 
-    # Filter the vectors that intersect the image bounds
-    labels_to_burn_gdf = labels_to_burn_gdf.loc[
-        labels_to_burn_gdf.intersects(
-            sh_geom.box(bounds.left, bounds.bottom, bounds.right, bounds.top)
-        )
-    ].copy()
+    # Filter the vectors that intersect the image bounds. Use the spatial index, so
+    # only the labels that are relevant for this image are passed to rasterize instead
+    # of all labels. None or empty geometries are never returned by the query.
+    if burn_geoms_tree is None:
+        burn_geoms_tree = shapely.STRtree(burn_geoms)
+    bounds_geom = sh_geom.box(*bbox)
+    labels_idx = burn_geoms_tree.query(bounds_geom, predicate="intersects")
+    labels_idx = np.sort(labels_idx)
 
     # Burn the vectors in a mask
-    burn_shapes = [
-        (geom, value)
-        for geom, value in zip(
-            labels_to_burn_gdf.geometry, labels_to_burn_gdf.burn_value
-        )
-        if geom is not None and geom.is_empty is False
-    ]
+    burn_shapes = list(zip(burn_geoms[labels_idx], burn_values[labels_idx]))
     if len(burn_shapes) > 0:
         try:
-            mask_arr = rio_features.rasterize(
-                shapes=burn_shapes,
-                transform=image_transform_affine,
-                dtype=rio.uint8,
-                fill=0,
-                out_shape=(
-                    image_output_profile["width"],
-                    image_output_profile["height"],
-                ),
-            )
+            env_options = {}
+            if "GDAL_CACHEMAX" not in os.environ:
+                env_options["GDAL_CACHEMAX"] = RASTERIZE_GDAL_CACHEMAX
+            with rio.Env(**env_options):
+                mask_arr = rio_features.rasterize(
+                    shapes=burn_shapes,
+                    transform=image_transform_affine,
+                    dtype=rio.uint8,
+                    fill=0,
+                    out_shape=(height, width),
+                )
 
         except Exception as ex:  # pragma: no cover
             raise RuntimeError(
                 f"Error creating mask for {image_transform_affine}"
             ) from ex
     else:
-        mask_arr = np.zeros(
-            shape=(
-                image_output_profile["width"],
-                image_output_profile["height"],
-            ),
-            dtype=rio.uint8,
-        )
+        mask_arr = np.zeros(shape=(height, width), dtype=rio.uint8)
 
     # Check if the mask meets the requirements to be written...
     if minimum_pct_labeled > 0:
-        nb_pixels = np.size(mask_arr, 0) * np.size(mask_arr, 1)
-        nb_pixels_data = nb_pixels - np.sum(
-            mask_arr == 0
-        )  # np.count_nonnan(image == NoData_value)
+        nb_pixels = mask_arr.size
+        nb_pixels_data = np.count_nonzero(mask_arr)
         logger.debug(
             f"nb_pixels: {nb_pixels}, nb_pixels_data: {nb_pixels_data}, "
             f"pct data: {nb_pixels_data / nb_pixels}"
@@ -858,8 +1089,13 @@ def _create_mask(
         if nb_pixels_data / nb_pixels < minimum_pct_labeled:
             return False
 
-    # Write the labeled mask as .png (so without transform/crs info)
-    im = Image.fromarray(mask_arr)
+    # Write the labeled mask as .png (so without transform/crs info).
+    # Use a palette image with a grey palette with an entry per class: PIL then writes
+    # the png with the minimal bit depth needed (e.g. 1 bit for 2 classes), while
+    # reading it as grayscale still gives the class values.
+    nb_colors = max(nb_classes, int(mask_arr.max()) + 1)
+    im = Image.frombytes("P", (width, height), mask_arr.tobytes())
+    im.putpalette(np.repeat(np.arange(nb_colors, dtype=np.uint8), 3).tobytes())
     im.save(output_mask_filepath)
 
     return True
@@ -3,6 +3,7 @@
 import logging
 import math
 import random
+import threading
 import time
 import warnings
 from concurrent import futures
@@ -55,6 +56,16 @@ FORMAT_PNG_EXT_WORLD = ".pgw"
 # Get a logger...
 logger = logging.getLogger(__name__)
 
+# Lock to avoid WMS services being initialized multiple times in parallel
+_wms_service_lock = threading.Lock()
+
+# The WMS services initialized in this process, so the capabilities of a WMS server
+# are only fetched and parsed once, also over different layer sources.
+_wms_services: dict[
+    tuple,
+    owslib.wms.wms111.WebMapService_1_1_1 | owslib.wms.wms130.WebMapService_1_3_0,
+] = {}
+
 
 class WMSLayerSource:
     """Properties of a WMS layer source."""
@@ -964,25 +975,14 @@ def load_image(
         try:
             # If it is a WMS layer source
             if isinstance(layersource, WMSLayerSource):
-                # Initialize WMS if this hasn't been done yet
+                # Initialize WMS if this hasn't been done yet. Use a lock, as the
+                # layersource can be shared by multiple threads.
                 if layersource.wms_service is None:
-                    auth = _interprete_ssl_verify(ssl_verify=ssl_verify)
-                    wms_service = owslib.wms.WebMapService(
-                        url=layersource.wms_server_url,
-                        version=layersource.wms_version,
-                        username=layersource.username,
-                        password=layersource.password,
-                        auth=auth,
-                    )
-                    if layersource.wms_ignore_capabilities_url:
-                        # If the wms url in capabilities should be ignored,
-                        # overwrite with original url
-                        nb = len(wms_service.getOperationByName("GetMap").methods)
-                        for method_id in range(nb):
-                            wms_service.getOperationByName("GetMap").methods[method_id][
-                                "url"
-                            ] = layersource.wms_server_url
-                    layersource.wms_service = wms_service
+                    with _wms_service_lock:
+                        if layersource.wms_service is None:
+                            layersource.wms_service = _get_wms_service(
+                                layersource, ssl_verify=ssl_verify
+                            )
 
                 # Get image from server, and retry up to 10 times...
                 nb_retries = 0
@@ -1158,6 +1158,52 @@ def load_image(
     return (image_data_output, image_profile_output)
 
 
+def _get_wms_service(
+    layersource: WMSLayerSource, ssl_verify: bool | str = True
+) -> owslib.wms.wms111.WebMapService_1_1_1 | owslib.wms.wms130.WebMapService_1_3_0:
+    """Get the WMS service for a layer source, reusing it if possible.
+
+    Should be called while holding _wms_service_lock.
+    """
+    key = (
+        layersource.wms_server_url,
+        layersource.wms_version,
+        layersource.username,
+        layersource.password,
+        layersource.wms_ignore_capabilities_url,
+        ssl_verify,
+    )
+    wms_service = _wms_services.get(key)
+    if wms_service is None:
+        wms_service = _create_wms_service(layersource, ssl_verify=ssl_verify)
+        _wms_services[key] = wms_service
+
+    return wms_service
+
+
+def _create_wms_service(
+    layersource: WMSLayerSource, ssl_verify: bool | str = True
+) -> owslib.wms.wms111.WebMapService_1_1_1 | owslib.wms.wms130.WebMapService_1_3_0:
+    auth = _interprete_ssl_verify(ssl_verify=ssl_verify)
+    wms_service = owslib.wms.WebMapService(
+        url=layersource.wms_server_url,
+        version=layersource.wms_version,
+        username=layersource.username,
+        password=layersource.password,
+        auth=auth,
+    )
+    if layersource.wms_ignore_capabilities_url:
+        # If the wms url in capabilities should be ignored,
+        # overwrite with original url
+        nb = len(wms_service.getOperationByName("GetMap").methods)
+        for method_id in range(nb):
+            wms_service.getOperationByName("GetMap").methods[method_id]["url"] = (
+                layersource.wms_server_url
+            )
+
+    return wms_service
+
+
 def create_filename(
     crs: pyproj.CRS, bbox, size, image_format: str, layername: str | None = None
 ) -> str:
@@ -2,6 +2,7 @@
 
 import datetime
 import logging
+import time
 
 # Get a logger...
 logger = logging.getLogger(__name__)
@@ -37,7 +38,12 @@ class ProgressLogger:
             self.start_time = datetime.datetime.now()
         else:
             self.start_time = start_time
-        self.start_time_lastreporting = self.start_time
+        # Use a monotonic clock to determine the time passed: it is cheaper than
+        # datetime.now() and isn't affected by changes to the system clock.
+        self._start_monotonic = time.monotonic() - (
+            (datetime.datetime.now() - self.start_time).total_seconds()
+        )
+        self._lastreporting_monotonic = self._start_monotonic
         self.nb_steps_total = nb_steps_total
         self.nb_steps_done = nb_steps_done
         self.nb_steps_done_lastreporting = nb_steps_done
@@ -74,20 +80,8 @@ class ProgressLogger:
         self.nb_steps_done += nb_steps
 
         # Calculate time since last reporting
-        time_now = datetime.datetime.now()
-        time_passed_lastprogress_s = (
-            time_now - self.start_time_lastreporting
-        ).total_seconds()
-
-        # Calculate the time_passed and nb_done we want to use to calculate ETA
-        if self.calculate_eta_since_lastreporting is True:
-            time_passed_for_eta_s = (
-                time_now - self.start_time_lastreporting
-            ).total_seconds()
-            nb_steps_done_eta = self.nb_steps_done - self.nb_steps_done_lastreporting
-        else:
-            time_passed_for_eta_s = (time_now - self.start_time).total_seconds()
-            nb_steps_done_eta = self.nb_steps_done
+        time_now = time.monotonic()
+        time_passed_lastprogress_s = time_now - self._lastreporting_monotonic
 
         # Print progress on first step, if sufficient time between reporting has passed
         # or if sufficient progress since last reporting
@@ -99,6 +93,16 @@ class ProgressLogger:
             or pct_progress_since_last_reporting > 0.1
             or self.first_reporting_done is False
         ):
+            # Calculate the time_passed and nb_done we want to use to calculate ETA
+            if self.calculate_eta_since_lastreporting is True:
+                time_passed_for_eta_s = time_passed_lastprogress_s
+                nb_steps_done_eta = (
+                    self.nb_steps_done - self.nb_steps_done_lastreporting
+                )
+            else:
+                time_passed_for_eta_s = time_now - self._start_monotonic
+                nb_steps_done_eta = self.nb_steps_done
+
             # Evade divisions by zero
             if time_passed_for_eta_s == 0 or nb_steps_done_eta == 0:
                 return
@@ -122,7 +126,7 @@ class ProgressLogger:
                 )
             logger.info(progress_message)
 
-            self.start_time_lastreporting = time_now
+            self._lastreporting_monotonic = time_now
             self.nb_steps_done_lastreporting = self.nb_steps_done
             if self.first_reporting_done is False:
                 self.first_reporting_done = True
@@ -30,20 +30,17 @@ def is_onborder(
         return gdf
 
     result_gdf = gdf.copy()
-    result_gdf[onborder_column_name] = 0
-
-    # Check
-    for i, geom_row in result_gdf.iterrows():
-        if geom_row["geometry"] is not None and not geom_row["geometry"].is_empty:
-            # Check if the geom is on the border of the tile
-            geom_bounds = geom_row["geometry"].bounds
-            if (
-                geom_bounds[0] <= border_bounds[0]
-                or geom_bounds[1] <= border_bounds[1]
-                or geom_bounds[2] >= border_bounds[2]
-                or geom_bounds[3] >= border_bounds[3]
-            ):
-                result_gdf.loc[i, onborder_column_name] = 1
+
+    # Check if the geoms are on the border of the tile, vectorized for all geoms.
+    # The bounds of None or empty geoms are NaN, so they are never on the border.
+    geoms_bounds = shapely.bounds(result_gdf.geometry.array)
+    onborder = (
+        (geoms_bounds[:, 0] <= border_bounds[0])
+        | (geoms_bounds[:, 1] <= border_bounds[1])
+        | (geoms_bounds[:, 2] >= border_bounds[2])
+        | (geoms_bounds[:, 3] >= border_bounds[3])
+    )
+    result_gdf[onborder_column_name] = onborder.astype("int64")
 
     assert isinstance(result_gdf, gpd.GeoDataFrame)
     return result_gdf
@@ -8,6 +8,7 @@ from pathlib import Path
 
 import geofileops as gfo
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import pytest
 import shapely
@@ -39,6 +40,24 @@ def test_read_prediction_file():
     assert len(pred_raster_gdf) == len(pred_comparison_gdf)
 
 
+@pytest.mark.parametrize("shape", [(32, 48), (32, 48, 1)])
+@pytest.mark.parametrize("dtype", [np.float32, np.uint8])
+def test_clean_prediction(shape: tuple, dtype):
+    # Prepare test data: a prediction with a probability of 0.8 in a square
+    image_pred_arr = np.zeros(shape, dtype=np.float32)
+    image_pred_arr[10:20, 10:30] = 0.8
+    if dtype == np.uint8:
+        image_pred_arr = (image_pred_arr * 255).astype(np.uint8)
+
+    result = post_pred.clean_prediction(image_pred_arr, border_pixels_to_ignore=12)
+
+    # The result is always 2D, binary and the border pixels are ignored
+    assert result.shape == (32, 48)
+    assert result.dtype == np.uint8
+    assert set(np.unique(result)) == {0, 255}
+    assert np.count_nonzero(result) == (20 - 12) * (30 - 12)
+
+
 def test_clean_vectordata(tmpdir):
     temp_dir = Path(tmpdir)
 
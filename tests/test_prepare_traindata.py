@@ -10,6 +10,7 @@ from pathlib import Path
 
 import geofileops as gfo
 import geopandas as gpd
+import numpy as np
 import pytest
 from PIL import Image
 from shapely import geometry as sh_geom
@@ -397,3 +398,129 @@ def test_prepare_traindatasets_reuse_prev_images(
                 # File is only supposed to be in previous locations, not in new
                 assert not new_path.exists()
                 assert prev_path.exists()
+
+
+def test_prepare_traindatasets_reuse_interrupted_images(tmp_path, empty_image):
+    """Test if images downloaded in an interrupted run are reused."""
+    # Prepare test data
+    classes = TestData.classes
+    image_layers_config_path = test_helper.sampleprojects_dir / "imagelayers.ini"
+    image_layers = config_helper._read_layer_config(image_layers_config_path)
+    training_dir = tmp_path / "training"
+
+    # Prepare the temp dir of an interrupted run with the images of all locations
+    interrupted_dir = training_dir / "01_TMP_00"
+    (interrupted_dir / "train" / "image").mkdir(parents=True)
+    manifest_path = interrupted_dir / prep_traindata.IMAGES_MANIFEST_NAME
+    with manifest_path.open("w") as manifest:
+        for loc in ["loc1", "loc2"]:
+            image_path = interrupted_dir / "train" / "image" / locations[loc][2]
+            shutil.copy(empty_image, image_path)
+            image_path.with_suffix(".pgw").touch()
+            manifest.write(f'{{"image": "train/image/{image_path.name}"}}\n')
+        # The last line can be incomplete if the run was interrupted
+        manifest.write('{"image": "train/ima')
+
+    locations_list = []
+    for loc in ["loc1", "loc2"]:
+        xmin, ymin, _ = locations[loc]
+        geometry = sh_geom.box(
+            xmin,
+            ymin,
+            xmin + TestData.image_crs_width,
+            ymin + TestData.image_crs_height,
+        )
+        for traindata_type in ["train", "validation"]:
+            locations_list.append(
+                {"geometry": geometry, "traindata_type": traindata_type}
+            )
+    locations_gdf = gpd.GeoDataFrame(locations_list, crs=31370)
+    label_infos = _prepare_labelinfos(tmp_path=tmp_path, locations=locations_gdf)
+
+    # Run prepare traindatasets
+    new_training_dir, dataversion = prep_traindata.prepare_traindatasets(
+        label_infos=label_infos,
+        classes=classes,
+        image_layers=image_layers,
+        training_dir=training_dir,
+    )
+
+    # All images should be reused, for all traindata types
+    assert dataversion == 1
+    for traindata_type in ["train", "validation"]:
+        for loc in ["loc1", "loc2"]:
+            new_path = new_training_dir / traindata_type / "image" / locations[loc][2]
+            assert filecmp.cmp(empty_image, new_path, shallow=False) is True
+            mask_path = new_training_dir / traindata_type / "mask" / locations[loc][2]
+            assert mask_path.exists()
+
+    # The temp dir of the interrupted run and the manifest should be cleaned up
+    assert not interrupted_dir.exists()
+    assert not (new_training_dir / prep_traindata.IMAGES_MANIFEST_NAME).exists()
+
+
+def _prepare_mask_bbox(width: int, height: int) -> tuple[float, float, float, float]:
+    xmin, ymin = TestData.crs_xmin, TestData.crs_ymin
+    xmax = xmin + width * TestData.image_pixel_x_size
+    ymax = ymin + height * TestData.image_pixel_y_size
+    return (xmin, ymin, xmax, ymax)
+
+
+@pytest.mark.parametrize(
+    "minimum_pct_labeled, expected_result",
+    [(0.0, True), (0.4, True), (0.6, False)],
+)
+def test_create_mask_minimum_pct_labeled(
+    tmp_path, minimum_pct_labeled, expected_result
+):
+    # Prepare test data: a label covering the left half of the image
+    xmin, ymin, xmax, ymax = _prepare_mask_bbox(width=32, height=32)
+    labels_gdf = gpd.GeoDataFrame(
+        {"burn_value": [1]},
+        geometry=[sh_geom.box(xmin, ymin, (xmin + xmax) / 2, ymax)],
+        crs=TestData.crs,
+    )
+
+    # Test
+    mask_path = tmp_path / "mask.png"
+    result = prep_traindata._create_mask(
+        output_mask_filepath=mask_path,
+        burn_geoms=labels_gdf.geometry.to_numpy(),
+        burn_values=labels_gdf["burn_value"].to_numpy(),
+        bbox=(xmin, ymin, xmax, ymax),
+        size=(32, 32),
+        minimum_pct_labeled=minimum_pct_labeled,
+    )
+
+    # Check result
+    assert result is expected_result
+    assert mask_path.exists() is expected_result
+
+
+def test_create_mask_non_square(tmp_path):
+    """Test creating a mask for an image that is wider than it is high."""
+    # Prepare test data: a label covering the left half of the image
+    width, height = 64, 32
+    xmin, ymin, xmax, ymax = _prepare_mask_bbox(width, height)
+    labels_gdf = gpd.GeoDataFrame(
+        {"burn_value": [1]},
+        geometry=[sh_geom.box(xmin, ymin, (xmin + xmax) / 2, ymax)],
+        crs=TestData.crs,
+    )
+
+    # Test
+    mask_path = tmp_path / "mask.png"
+    result = prep_traindata._create_mask(
+        output_mask_filepath=mask_path,
+        burn_geoms=labels_gdf.geometry.to_numpy(),
+        burn_values=labels_gdf["burn_value"].to_numpy(),
+        bbox=(xmin, ymin, xmax, ymax),
+        size=(width, height),
+    )
+
+    # Check result
+    assert result is True
+    mask_arr = np.asarray(Image.open(mask_path))
+    assert mask_arr.shape == (height, width)
+    assert np.all(mask_arr[:, : width // 2] == 1)
+    assert np.all(mask_arr[:, width // 2 :] == 0)